@@ -1,39 +1,269 @@
+import asyncio
 import os
+import functools
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 import json
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import datetime as dt
 from dotenv import load_dotenv
 from enum import Enum
 from .factfind import User, Goal, GoalType, NewHomeGoalInformation, NewCarInformation, OtherGoalInformation
 from google import genai
-from google.api_core.exceptions import GoogleAPIError
+from google.genai import errors
 
 load_dotenv()
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+LLM_CACHE_SIZE = 1024
+LLM_MAX_RETRIES = 3 # Retries for rate limits (429) and server errors (5xx), with exponential backoff
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_CACHE_DB = os.environ.get("LLM_CACHE_DB") # Optional SQLite file so cached responses survive restarts
 
-def llm(prompt: str) -> str:
-    client = genai.Client(api_key=GEMINI_API_KEY)
+@functools.lru_cache(maxsize=1)
+def _get_client() -> genai.Client:
+    # One client for the whole process so every call reuses the same pooled HTTPS connection
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _json_complete(text: str) -> bool:
+    # True once text holds a full top-level JSON object, so the rest of the stream can be dropped
+    start = text.find("{")
+    if start == -1:
+        return False
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[{"role": "user", "parts": [{"text": prompt}]}]
-        )
-        return response.text
-    except GoogleAPIError as e:
-        print(f"Error calling Gemini API: {e}")
+        _JSON_DECODER.raw_decode(text, start)
+        return True
+    except ValueError:
+        return False
+
+# Exact-match response cache, keyed on the whitespace-normalized prompt so retries and repeated phrasings skip the round-trip
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock() # Prefetch threads share the cache with the caller; held only for dict operations
+_db_lock = threading.Lock() # The SQLite connection is shared across threads
+
+def _cache_key(prompt: str, text: Optional[str], stop_after_json: bool) -> str:
+    normalized = " ".join(prompt.split()) + "\0" + " ".join((text or "").split())
+    return hashlib.sha256(f"{stop_after_json}:{normalized}".encode()).hexdigest()
+
+@functools.lru_cache(maxsize=1)
+def _get_cache_db() -> Optional[sqlite3.Connection]:
+    if not LLM_CACHE_DB:
+        return None
+    db = sqlite3.connect(LLM_CACHE_DB, check_same_thread=False)
+    db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+    return db
+
+def _memory_cache_get(key: str) -> Optional[str]:
+    with _cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+        return None
+
+def _memory_cache_put(key: str, response: str) -> None:
+    with _cache_lock:
+        _response_cache[key] = response
+        _response_cache.move_to_end(key)
+        if len(_response_cache) > LLM_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+def _db_cache_get(key: str) -> Optional[str]:
+    db = _get_cache_db()
+    if db is None:
         return None
+    with _db_lock:
+        row = db.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _db_cache_put(key: str, response: str) -> None:
+    db = _get_cache_db()
+    if db is None:
+        return
+    with _db_lock, db:
+        db.execute("INSERT OR REPLACE INTO llm_cache (key, response) VALUES (?, ?)", (key, response))
+
+def _cache_get(key: str) -> Optional[str]:
+    cached = _memory_cache_get(key)
+    if cached is None:
+        cached = _db_cache_get(key)
+        if cached is not None:
+            _memory_cache_put(key, cached)
+    return cached
+
+def _cache_put(key: str, response: str) -> None:
+    _memory_cache_put(key, response)
+    _db_cache_put(key, response)
+
+# The SQLite tier blocks, so the async path runs it in a worker thread instead of on the event loop
+async def _cache_get_async(key: str) -> Optional[str]:
+    cached = _memory_cache_get(key)
+    if cached is None and LLM_CACHE_DB:
+        cached = await asyncio.to_thread(_db_cache_get, key)
+        if cached is not None:
+            _memory_cache_put(key, cached)
+    return cached
+
+async def _cache_put_async(key: str, response: str) -> None:
+    _memory_cache_put(key, response)
+    if LLM_CACHE_DB:
+        await asyncio.to_thread(_db_cache_put, key, response)
+
+def _contents(prompt: str, text: Optional[str]) -> list[dict]:
+    # Static instructions go first and dynamic text in its own message, so the prompt prefix stays cacheable on Gemini's side
+    contents = [{"role": "user", "parts": [{"text": prompt}]}]
+    if text is not None:
+        contents.append({"role": "user", "parts": [{"text": text}]})
+    return contents
+
+def _retry_delay(error: errors.APIError, attempt: int) -> Optional[float]:
+    # Seconds to wait before retrying, or None if the error is fatal or we are out of retries
+    transient = isinstance(error, errors.ServerError) or error.code == 429
+    if not transient or attempt >= LLM_MAX_RETRIES:
+        return None
+    return LLM_RETRY_BASE_DELAY * 2 ** attempt
+
+def _generate(prompt: str, text: Optional[str], stop_after_json: bool) -> str:
+    # Stream the response so JSON callers can stop reading as soon as the object is closed
+    stream = _get_client().models.generate_content_stream(
+        model="gemini-2.0-flash",
+        contents=_contents(prompt, text)
+    )
+    chunks = []
+    try:
+        for chunk in stream:
+            chunk_text = chunk.text or ""
+            chunks.append(chunk_text)
+            if stop_after_json and "}" in chunk_text and _json_complete("".join(chunks)):
+                break
+    finally:
+        stream.close() # Cancels the underlying HTTP stream if we stopped early
+    return "".join(chunks)
 
-STOP_COMMANDS = {"exit", "quit", "stop", "done"}
+async def _generate_async(prompt: str, text: Optional[str], stop_after_json: bool) -> str:
+    stream = await _get_client().aio.models.generate_content_stream(
+        model="gemini-2.0-flash",
+        contents=_contents(prompt, text)
+    )
+    chunks = []
+    try:
+        async for chunk in stream:
+            chunk_text = chunk.text or ""
+            chunks.append(chunk_text)
+            if stop_after_json and "}" in chunk_text and _json_complete("".join(chunks)):
+                break
+    finally:
+        await stream.aclose()
+    return "".join(chunks)
+
+def _cacheable(response: str, validate: Optional[Callable[[str], Any]]) -> bool:
+    # Only cache replies the caller can use, so resending a message after a bad reply reaches the model again
+    if not response: # Failures and empty replies are never cached so they get retried
+        return False
+    if validate is None:
+        return True
+    try:
+        return bool(validate(response))
+    except Exception:
+        return False
+
+def llm(prompt: str, text: Optional[str] = None, stop_after_json: bool = False, validate: Optional[Callable[[str], Any]] = None) -> str:
+    key = _cache_key(prompt, text, stop_after_json)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    attempt = 0
+    while True:
+        try:
+            response = _generate(prompt, text, stop_after_json)
+            break
+        except errors.APIError as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                print(f"Error calling Gemini API: {e}")
+                return None
+            time.sleep(delay)
+            attempt += 1
+
+    if _cacheable(response, validate):
+        _cache_put(key, response)
+    return response
+
+async def llm_async(prompt: str, text: Optional[str] = None, stop_after_json: bool = False, validate: Optional[Callable[[str], Any]] = None) -> str:
+    # Same as llm() but on the client's asyncio API, so concurrent conversations don't block each other
+    key = _cache_key(prompt, text, stop_after_json)
+    cached = await _cache_get_async(key)
+    if cached is not None:
+        return cached
+
+    attempt = 0
+    while True:
+        try:
+            response = await _generate_async(prompt, text, stop_after_json)
+            break
+        except errors.APIError as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                print(f"Error calling Gemini API: {e}")
+                return None
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    if _cacheable(response, validate):
+        await _cache_put_async(key, response)
+    return response
+
+STOP_COMMANDS = frozenset({"exit", "quit", "stop", "done"})
+
+# Compiled once at import so parse_date/parse_currency never hit the re module cache
+_RE_DIGITS = re.compile(r'\d+')
+_RE_MONTH_YEAR = re.compile(r'^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{4}$', re.I)
+_RE_YEAR = re.compile(r'^20\d{2}$')
+# Number plus optional multiplier suffix, e.g. "1.5m", "50 k", "2bn", "2 millions"; the word boundary
+# sits inside the optional group so a missing suffix never backtracks into the number
+_RE_AMOUNT = re.compile(r'([\d.]+)\s*(?:(millions?|billions?|thousands?|mill|mil|bn|mn|m|b|k)\b)?', re.I)
+_AMOUNT_MULTIPLIERS = {
+    "million": 1_000_000,
+    "millions": 1_000_000,
+    "billion": 1_000_000_000,
+    "billions": 1_000_000_000,
+    "thousand": 1_000,
+    "thousands": 1_000,
+    "mill": 1_000_000,
+    "mil": 1_000_000,
+    "mn": 1_000_000,
+    "bn": 1_000_000_000,
+    "m": 1_000_000,
+    "b": 1_000_000_000,
+    "k": 1_000,
+    None: 1,
+}
+# Fenced JSON block in an LLM reply; the closing fence is optional because streamed replies stop at the closing brace
+_RE_JSON_FENCE = re.compile(r'```json\s*(.*?)\s*(?:```|$)', re.S)
+
+# Candidate strptime formats keyed by the shape of the date string, so parse_date only tries formats that can match
+_DATE_FORMATS = {
+    "-": ("%Y-%m-%d",),
+    "/": ("%d/%m/%Y", "%m/%d/%Y"),
+    "month_name": ("%B %d, %Y", "%b %d, %Y"),
+}
+
+_FMT_USD = "${:,.2f}".format
 
 class Sender(Enum):
     USER = "user"
     AI = "ai"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Message:
     text: str
     sender: Sender
@@ -46,7 +276,7 @@ class ConversationStage(Enum):
     ADD_ANOTHER_GOAL = "add_another_goal" # ask yes or no
     COMPLETED = "completed" # End the conversation with stop commands
 
-@dataclass
+@dataclass(slots=True)
 class ExtractedInformation:
     user: Optional[User] = None
     pending_goal: Optional[Goal] = None
@@ -56,53 +286,60 @@ class ExtractedInformation:
         if not self.user:
             return "No user information collected yet."
             
-        user_info = f"User: {self.user.first_name} {self.user.last_name}, Email: {self.user.email}, DOB: {self.user.date_of_birth}"
-        goals_info = []
+        # Everything goes into one buffer and is joined once at the end
+        buf = [f"User: {self.user.first_name} {self.user.last_name}, Email: {self.user.email}, DOB: {self.user.date_of_birth}", "\n\nGoals:\n"]
         
         for i, goal in enumerate(self.user.goals):
-            goal_str = f"Goal {i+1}: {goal.goal_name} ({goal.goal_type.value})"
+            if i:
+                buf.append("\n\n")
+            buf.append(f"Goal {i+1}: {goal.goal_name} ({goal.goal_type.value})")
             
-            if isinstance(goal.goal_specific_information, NewHomeGoalInformation):
-                info = goal.goal_specific_information
-                goal_str += (f"\n  Location: {info.location}"
-                            f"\n  Price: ${info.house_price:,.2f}"
-                            f"\n  Deposit: ${info.deposit_amount:,.2f}"
-                            f"\n  Target Date: {info.purchase_date}")
+            info = goal.goal_specific_information
+            if isinstance(info, NewHomeGoalInformation):
+                buf.append(f"\n  Location: {info.location}"
+                           f"\n  Price: {_FMT_USD(info.house_price)}"
+                           f"\n  Deposit: {_FMT_USD(info.deposit_amount)}"
+                           f"\n  Target Date: {info.purchase_date}")
                             
-            elif isinstance(goal.goal_specific_information, NewCarInformation):
-                info = goal.goal_specific_information
-                goal_str += (f"\n  Car: {info.car_type}"
-                            f"\n  Price: ${info.car_price:,.2f}"
-                            f"\n  Target Date: {info.purchase_date}")
+            elif isinstance(info, NewCarInformation):
+                buf.append(f"\n  Car: {info.car_type}"
+                           f"\n  Price: {_FMT_USD(info.car_price)}"
+                           f"\n  Target Date: {info.purchase_date}")
                             
-            elif isinstance(goal.goal_specific_information, OtherGoalInformation):
-                info = goal.goal_specific_information
-                goal_str += (f"\n  Description: {info.description}"
-                            f"\n  Amount Needed: ${info.amount_required:,.2f}"
-                            f"\n  Target Date: {info.target_date}")
-            
-            goals_info.append(goal_str)
+            elif isinstance(info, OtherGoalInformation):
+                buf.append(f"\n  Description: {info.description}"
+                           f"\n  Amount Needed: {_FMT_USD(info.amount_required)}"
+                           f"\n  Target Date: {info.target_date}")
         
-        return f"{user_info}\n\nGoals:\n" + "\n\n".join(goals_info)
+        return "".join(buf)
 
-@dataclass
+@dataclass(slots=True)
 class ConversationState:
     finished: bool = False
     messages: list[Message] = field(default_factory=list)
     new_messages: list[Message] = field(default_factory=list)
     extracted_information: ExtractedInformation = field(default_factory=ExtractedInformation)
+    # Speculative extract_goal_details call started from the user info message: (goal type, Future or asyncio.Task)
+    prefetched_goal_details: Optional[tuple[GoalType, Any]] = field(default=None, repr=False)
 
 def parse_date(date_str: str) -> Optional[dt.date]:
     if not date_str:
         return None
     
+    # Fast path for YYYY-MM-DD, which is what the LLM is prompted to return
+    if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+        try:
+            return dt.date.fromisoformat(date_str)
+        except ValueError:
+            pass
+    
     date_str = date_str.lower().strip()
     today = dt.date.today()
     
     # Handle relative dates like "in 3 months"
     if date_str.startswith("in "):
         try:
-            num = int(re.search(r'\d+', date_str).group())
+            num = int(_RE_DIGITS.search(date_str).group())
             if "day" in date_str:
                 return today + dt.timedelta(days=num)
             elif "week" in date_str:
@@ -123,15 +360,23 @@ def parse_date(date_str: str) -> Optional[dt.date]:
     if date_str == "next year":
         return dt.date(today.year + 1, 1, 1)
     
-    # Try standard date formats
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%B %d, %Y", "%b %d, %Y"): # For loop through all the standards until 1 matches
+    # Try standard date formats, picking candidates by shape instead of raising through every format
+    if date_str[:1].isalpha():
+        shape = "month_name" if "," in date_str else None
+    elif "/" in date_str:
+        shape = "/"
+    elif "-" in date_str:
+        shape = "-"
+    else:
+        shape = None
+    for fmt in _DATE_FORMATS.get(shape, ()):
         try:
             return dt.datetime.strptime(date_str, fmt).date()
         except ValueError:
             continue
     
     # Handle word format date
-    if re.match(r'^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{4}$', date_str, re.I):
+    if _RE_MONTH_YEAR.match(date_str):
         try:
             return dt.datetime.strptime(date_str, "%B %Y").date()
         except:
@@ -140,7 +385,7 @@ def parse_date(date_str: str) -> Optional[dt.date]:
             except:
                 pass
     
-    if re.match(r'^20\d{2}$', date_str):
+    if _RE_YEAR.match(date_str):
         return dt.date(int(date_str), 1, 1)
     
     return None
@@ -151,313 +396,440 @@ def parse_currency(amount: str) -> Optional[float]:
     
     amount = amount.lower().replace(",", "").strip()
     
-    # Extract number
+    # Extract number and its multiplier suffix in one match
+    match = _RE_AMOUNT.search(amount)
+    if not match:
+        return None
     try:
-        numeric_part = float(re.search(r'[\d.]+', amount).group())
-    except:
+        numeric_part = float(match.group(1))
+    except ValueError:
         return None
     
-    # Extract amount and multiply to number
-    if "million" in amount:
-        return numeric_part * 1000000
-    elif "billion" in amount:
-        return numeric_part * 1000000000
-    elif "thousand" in amount:
-        return numeric_part * 1000
-    elif "m" in amount and "million" not in amount:
-        return numeric_part * 1000000
-    elif "b" in amount and "billion" not in amount:
-        return numeric_part * 1000000000
-    elif "k" in amount:
-        return numeric_part * 1000
-    
     # Currently only keep amount, not regarding the currency
-    if any(symbol in amount for symbol in "$£€¥"):
-        return numeric_part
-    
-    return numeric_part
+    return numeric_part * _AMOUNT_MULTIPLIERS[match.group(2)]
+
+# Prompts are plain constants (no interpolation) so every request shares the same prefix;
+# the user's text and today's date are sent as a separate message
+# use rules so that LLM output data in a way code can easily handle
+USER_INFO_PROMPT = """Extract personal information from the text in the next message.
+
+Rules:
+- First name and last name must be separated
+- Date of birth must be in YYYY-MM-DD format (convert if needed)
+- Email must be valid format
+
+Return JSON with these exact fields:
+{
+    "first_name": "string (required)",
+    "last_name": "string (required)",
+    "date_of_birth": "string as YYYY-MM-DD (required)",
+    "email": "string (required)"
+}
+"""
+
+HOME_GOAL_PROMPT = """Extract home purchase details from the text in the next message.
+
+Return JSON with:
+- location
+- house_price (number)
+- deposit_amount (number)
+- purchase_date (YYYY-MM-DD format)
+
+Rules:
+- Convert amounts to numbers (e.g. "1.5M" → 1500000)
+- For relative dates like "in 3 years", calculate the exact date from today's date given in the next message
+- For month names, use full month name (e.g. "January")
+"""
+
+CAR_GOAL_PROMPT = """Extract car purchase details from the text in the next message.
+
+Return JSON with:
+- car_type (make + model)
+- car_price (number)
+- purchase_date (YYYY-MM-DD format)
+
+Rules:
+- Convert amounts to numbers (e.g. "20k" → 20000)
+- For relative dates like "next month", calculate the exact date from today's date given in the next message
+"""
+
+OTHER_GOAL_PROMPT = """Extract financial goal details from the text in the next message.
+
+Return JSON with:
+- description
+- amount_required (number)
+- target_date (YYYY-MM-DD format)
+
+Rules:
+- Convert amounts to numbers
+- For relative dates like "by next year", calculate the exact date from today's date given in the next message
+"""
+
+# Prompt per goal type, looked up once instead of branching on every call
+_GOAL_PROMPTS = {
+    GoalType.NEW_HOME: HOME_GOAL_PROMPT,
+    GoalType.NEW_CAR: CAR_GOAL_PROMPT,
+    GoalType.OTHER: OTHER_GOAL_PROMPT,
+}
+_GOAL_MESSAGE = "Today's date: {today}\nText: {text}"
+
+def _json_payload(response: str) -> str:
+    m = _RE_JSON_FENCE.search(response)
+    return m.group(1) if m else response
+
+def _decode_json(response: str) -> Any:
+    # raw_decode stops at the end of the first JSON object, so prose the model adds around it doesn't fail the turn
+    payload = _json_payload(response)
+    start = payload.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in LLM response")
+    data, _ = _JSON_DECODER.raw_decode(payload, start)
+    return data
+
+def _parse_user_info(response: Optional[str]) -> dict:
+    if not response:
+        return {}
+    return _decode_json(response) # Convert JSON string to Python dictionary
 
 def extract_user_info(text: str) -> dict:
     # Use LLM to process natural language input from users
-    prompt = f"""Extract personal information from this text: 
-    "{text}"
-    
-    Rules:
-    - First name and last name must be separated
-    - Date of birth must be in YYYY-MM-DD format (convert if needed)
-    - Email must be valid format
-    
-    Return JSON with these exact fields:
-    {{
-        "first_name": "string (required)",
-        "last_name": "string (required)",
-        "date_of_birth": "string as YYYY-MM-DD (required)",
-        "email": "string (required)"
-    }}
-    """
-    # use rules so that LLM output data in a way code can easily handle
-    
     try:
-        response = llm(prompt) # Call LLM API to process the text and extract structured information
-        if not response:
-            return {}
-            
-        if '```json' in response:
-            response = response.split('```json')[1].split('```')[0]
-        return json.loads(response.strip()) # Convert JSON string to Python dictionary
+        response = llm(USER_INFO_PROMPT, text, stop_after_json=True, validate=_parse_user_info) # Call LLM API to process the text and extract structured information
+        return _parse_user_info(response)
     except Exception as e:
         print(f"Error parsing user info: {e}")
         return {}
 
-def extract_goal_details(text: str, goal_type: GoalType) -> Optional[Dict]:
+async def extract_user_info_async(text: str) -> dict:
+    try:
+        response = await llm_async(USER_INFO_PROMPT, text, stop_after_json=True, validate=_parse_user_info)
+        return _parse_user_info(response)
+    except Exception as e:
+        print(f"Error parsing user info: {e}")
+        return {}
+
+@functools.lru_cache(maxsize=1)
+def _today_iso_cached(bucket: int) -> str:
+    return dt.date.today().isoformat()
+
+def _today_iso() -> str:
+    # The bucket changes every minute, so the date string is rebuilt at most once a minute
+    return _today_iso_cached(int(time.time()) // 60)
+
+def _goal_prompt(text: str, goal_type: GoalType) -> tuple[str, str]:
     # Because we have specific goal that the user have, we can separate car and other goals easily. 
-    if goal_type == GoalType.NEW_HOME:
-        prompt = f"""Extract home purchase details from:
-        "{text}"
-        
-        Return JSON with:
-        - location
-        - house_price (number)
-        - deposit_amount (number)
-        - purchase_date (YYYY-MM-DD format)
-        
-        Rules:
-        - Convert amounts to numbers (e.g. "1.5M" → 1500000)
-        - For relative dates like "in 3 years", calculate the exact date from today ({dt.date.today()})
-        - For month names, use full month name (e.g. "January")
-        """
-    elif goal_type == GoalType.NEW_CAR:
-        prompt = f"""Extract car purchase details from:
-        "{text}"
-        
-        Return JSON with:
-        - car_type (make + model)
-        - car_price (number)
-        - purchase_date (YYYY-MM-DD format)
-        
-        Rules:
-        - Convert amounts to numbers (e.g. "20k" → 20000)
-        - For relative dates like "next month", calculate the exact date from today ({dt.date.today()})
-        """
-    else:
-        prompt = f"""Extract financial goal details from:
-        "{text}"
-        
-        Return JSON with:
-        - description
-        - amount_required (number)
-        - target_date (YYYY-MM-DD format)
+    return _GOAL_PROMPTS[goal_type], _GOAL_MESSAGE.format(today=_today_iso(), text=text)
+
+def _parse_goal_details(response: Optional[str]) -> Optional[Dict]:
+    if not response:
+        return None
         
-        Rules:
-        - Convert amounts to numbers
-        - For relative dates like "by next year", calculate the exact date from today ({dt.date.today()})
-        """
+    data = _decode_json(response)
     
-    try:
-        response = llm(prompt) # Send user input to LLM to process
-        if not response:
+    # Additional date validation
+    if 'purchase_date' in data or 'target_date' in data:
+        date_key = 'purchase_date' if 'purchase_date' in data else 'target_date'
+        date_str = data[date_key]
+        parsed_date = parse_date(date_str)
+        if parsed_date:
+            data[date_key] = str(parsed_date)
+        else:
             return None
             
-        if '```json' in response:
-            response = response.split('```json')[1].split('```')[0]
-        data = json.loads(response.strip())
-        
-        # Additional date validation
-        if 'purchase_date' in data or 'target_date' in data:
-            date_key = 'purchase_date' if 'purchase_date' in data else 'target_date'
-            date_str = data[date_key]
-            parsed_date = parse_date(date_str)
-            if parsed_date:
-                data[date_key] = str(parsed_date)
-            else:
-                return None
-                
-        return data
+    return data
+
+def extract_goal_details(text: str, goal_type: GoalType) -> Optional[Dict]:
+    prompt, message = _goal_prompt(text, goal_type)
+    try:
+        response = llm(prompt, message, stop_after_json=True, validate=_parse_goal_details) # Send user input to LLM to process
+        return _parse_goal_details(response)
     except Exception as e:
         print(f"Error extracting goal details: {e}")
         return None
 
+async def extract_goal_details_async(text: str, goal_type: GoalType) -> Optional[Dict]:
+    prompt, message = _goal_prompt(text, goal_type)
+    try:
+        response = await llm_async(prompt, message, stop_after_json=True, validate=_parse_goal_details)
+        return _parse_goal_details(response)
+    except Exception as e:
+        print(f"Error extracting goal details: {e}")
+        return None
+
+# Whole-word goal keywords used only to decide whether to speculate, checked in order: home before car, with house only as a fallback
+_GOAL_KEYWORDS = (
+    (re.compile(r'\bhomes?\b'), GoalType.NEW_HOME),
+    (re.compile(r'\bcars?\b'), GoalType.NEW_CAR),
+    (re.compile(r'\bhouses?\b'), GoalType.NEW_HOME),
+)
+_RE_EMAIL = re.compile(r'\S+@\S+')
+
+@functools.lru_cache(maxsize=1)
+def _get_prefetch_pool() -> ThreadPoolExecutor:
+    # Speculative goal detail extraction runs here while the user answers the goal type question;
+    # created on first use so conversations that never speculate don't start worker threads
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="goal-prefetch")
+
+def _infer_goal_type(reply: str) -> Optional[GoalType]:
+    for keyword, goal_type in _GOAL_KEYWORDS:
+        if keyword.search(reply):
+            return goal_type
+    return None
+
+def _goal_type_answer(reply: str) -> GoalType:
+    # How the goal type question has always been answered: plain substring checks, home before car
+    if "home" in reply:
+        return GoalType.NEW_HOME
+    if "car" in reply:
+        return GoalType.NEW_CAR
+    return GoalType.OTHER
+
+def _prefetch_goal_type(reply: str) -> Optional[GoalType]:
+    # A speculative call is only used when the whole-word guess agrees with the actual answer
+    goal_type = _goal_type_answer(reply)
+    return goal_type if _infer_goal_type(reply) == goal_type else None
+
+def _take_prefetched(state: ConversationState, goal_type: Optional[GoalType]) -> Optional[Dict]:
+    # Hand back the speculative extraction if it guessed this goal type and has already finished,
+    # otherwise drop it so the turn never waits on speculation and the details question is asked as usual
+    prefetched, state.prefetched_goal_details = state.prefetched_goal_details, None
+    if prefetched is None:
+        return None
+    guessed, pending = prefetched
+    if guessed == goal_type and pending.done() and not pending.cancelled():
+        return pending.result()
+    pending.cancel()
+    return None
+
+def _should_prefetch(stage: ConversationStage, state: ConversationState, reply: str) -> Optional[GoalType]:
+    # User info has just been collected and the same message already mentions a home or car goal;
+    # the email is dropped first so an address like ada@scarlet.com can't trigger a paid call
+    if stage == ConversationStage.GET_USER_INFO and state.extracted_information.conversation_stage == ConversationStage.GET_GOAL_TYPE:
+        return _infer_goal_type(_RE_EMAIL.sub(" ", reply))
+    return None
+
 def chat_response(state: ConversationState) -> ConversationState:
     extracted = state.extracted_information
+    stage = extracted.conversation_stage
     last_message = state.messages[-1].text if state.messages else ""
+    reply = last_message.strip().lower() # Normalized once per turn for all the keyword checks
+
+    # Run the LLM extraction this stage needs (if any) first, then advance the conversation with its result
+    extraction = None
+    if reply not in STOP_COMMANDS:
+        if stage == ConversationStage.GET_USER_INFO:
+            extraction = extract_user_info(last_message)
+        elif stage == ConversationStage.GET_GOAL_TYPE:
+            extraction = _take_prefetched(state, _prefetch_goal_type(reply))
+        elif stage == ConversationStage.GET_GOAL_DETAILS:
+            extraction = extract_goal_details(last_message, extracted.pending_goal.goal_type)
+    state = _advance(state, reply, extraction)
+
+    goal_type = _should_prefetch(stage, state, reply)
+    if goal_type:
+        state.prefetched_goal_details = (goal_type, _get_prefetch_pool().submit(extract_goal_details, last_message, goal_type))
+    elif state.finished:
+        _take_prefetched(state, None) # Nothing will use a pending speculative call once the conversation is over
+    return state
+
+async def chat_response_async(state: ConversationState) -> ConversationState:
+    # Prefetched tasks belong to the running event loop, so all turns of a conversation must be served on one loop
+    extracted = state.extracted_information
+    stage = extracted.conversation_stage
+    last_message = state.messages[-1].text if state.messages else ""
+    reply = last_message.strip().lower()
+
+    extraction = None
+    if reply not in STOP_COMMANDS:
+        if stage == ConversationStage.GET_USER_INFO:
+            extraction = await extract_user_info_async(last_message)
+        elif stage == ConversationStage.GET_GOAL_TYPE:
+            extraction = _take_prefetched(state, _prefetch_goal_type(reply))
+        elif stage == ConversationStage.GET_GOAL_DETAILS:
+            extraction = await extract_goal_details_async(last_message, extracted.pending_goal.goal_type)
+    state = _advance(state, reply, extraction)
+
+    goal_type = _should_prefetch(stage, state, reply)
+    if goal_type:
+        state.prefetched_goal_details = (goal_type, asyncio.create_task(extract_goal_details_async(last_message, goal_type)))
+    elif state.finished:
+        _take_prefetched(state, None)
+    return state
+
+async def chat_responses_async(states: list[ConversationState]) -> list[ConversationState]:
+    # Serve several users at once: their LLM calls are in flight together on the shared client
+    return list(await asyncio.gather(*(chat_response_async(state) for state in states)))
+
+# Fixed AI replies, built once and shared by every conversation (Message is frozen, so sharing is safe)
+_MSG_ASK_USER_INFO = Message("Please provide your full name, date of birth (YYYY-MM-DD), and email", Sender.AI)
+_MSG_ASK_GOAL_TYPE = Message("Thank you! What financial goal would you like to discuss? (new home/new car/other)", Sender.AI)
+_MSG_ASK_GOAL_DETAILS = {
+    GoalType.NEW_HOME: Message("Please tell me about the home you want to buy (location, price, deposit, and timeline)", Sender.AI),
+    GoalType.NEW_CAR: Message("Please tell me about the car you want to buy (make/model, price, and timeline)", Sender.AI),
+    GoalType.OTHER: Message("Please describe your financial goal (what you want to achieve, how much money you'll need, and by when)", Sender.AI),
+}
+_REQUIRED_GOAL_FIELDS = {
+    GoalType.NEW_HOME: ("location", "house_price", "deposit_amount", "purchase_date"),
+    GoalType.NEW_CAR: ("car_type", "car_price", "purchase_date"),
+    GoalType.OTHER: ("description", "amount_required", "target_date"),
+}
+_MSG_RETRY_GOAL_DETAILS = {
+    GoalType.NEW_HOME: Message("I couldn't understand those home details. Please provide: location, price, deposit, and timeline (e.g. 'Buy $1.5M home in London with 50k deposit in 3 years')", Sender.AI),
+    GoalType.NEW_CAR: Message("I couldn't understand those car details. Please provide: make/model, price, and timeline (e.g. 'Buy a Tesla Model 3 for $40k in 6 months')", Sender.AI),
+    GoalType.OTHER: Message("I couldn't understand that goal. Please describe what you want to achieve, how much money you'll need, and by when (e.g. 'Start a business needing $50k by 2025')", Sender.AI),
+}
+_MSG_GOAL_SAVED = Message("Goal saved! Would you like to add another goal? (yes/no)", Sender.AI)
+_MSG_TRY_AGAIN = Message("Okay, let's try again. What goal would you like to discuss? (new home/new car/other)", Sender.AI)
+_MSG_ASK_ANOTHER_GOAL_TYPE = Message("What other financial goal would you like to discuss? (new home/new car/other)", Sender.AI)
+_MSG_THANK_YOU = Message("Thank you for providing your financial goals information.", Sender.AI)
+
+def _update_state(state: ConversationState, new_messages: list[Message], finished: bool) -> ConversationState:
+    # Update in place rather than copying the history, so each turn costs O(new messages) not O(conversation)
+    state.messages.extend(state.new_messages)
+    state.new_messages = new_messages
+    state.finished = finished
+    return state
+
+def _advance(state: ConversationState, reply: str, extraction: Optional[Dict]) -> ConversationState:
+    extracted = state.extracted_information
     new_messages = []
     
     # If user wants to stop the conversation
-    if last_message.lower().strip() in STOP_COMMANDS:
+    if reply in STOP_COMMANDS:
         extracted.conversation_stage = ConversationStage.COMPLETED
-        new_messages.append(Message(
-            text="Thank you for providing your financial goals information.",
-            sender=Sender.AI
-        ))
-        return ConversationState(
-            finished=True,
-            messages=state.messages + state.new_messages,
-            new_messages=new_messages,
-            extracted_information=extracted
-        )
+        new_messages.append(_MSG_THANK_YOU)
+        return _update_state(state, new_messages, finished=True)
     
-    # Collect user info
-    if extracted.conversation_stage == ConversationStage.GET_USER_INFO:
-        user_info = extract_user_info(last_message)
-        if all(k in user_info for k in ["first_name", "last_name", "date_of_birth", "email"]):
-            extracted.user = User(
-                first_name=user_info["first_name"],
-                last_name=user_info["last_name"],
-                date_of_birth=parse_date(user_info["date_of_birth"]),
-                email=user_info["email"],
-                goals=[]
-            )
-            extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
-            new_messages.append(Message(
-                text="Thank you! What financial goal would you like to discuss? (new home/new car/other)",
-                sender=Sender.AI
-            ))
-        # Missed info then ask again, currently the flaw is it only recognize if all info is in the input
-        else: # TO DO: add in handler that assess what is collected and form question based on what is missing
-            new_messages.append(Message(
-                text="Please provide your full name, date of birth (YYYY-MM-DD), and email",
-                sender=Sender.AI
-            ))
+    handler = _STAGE_HANDLERS.get(extracted.conversation_stage)
+    if handler:
+        handler(extracted, reply, extraction, new_messages)
     
-    # Get goal type
-    elif extracted.conversation_stage == ConversationStage.GET_GOAL_TYPE:
-        goal_type = last_message.lower()
-        # Got goal type (home), send question to explain what detail is needed. 
-        if "home" in goal_type:
-            extracted.pending_goal = Goal(
-                goal_type=GoalType.NEW_HOME,
-                goal_name="Buy a new home",
-                goal_specific_information=None
+    return _update_state(state, new_messages, finished=extracted.conversation_stage == ConversationStage.COMPLETED)
+
+# Collect user info
+def _handle_get_user_info(extracted: ExtractedInformation, reply: str, extraction: Optional[Dict], new_messages: list[Message]) -> None:
+    user_info = extraction
+    if all(k in user_info for k in ["first_name", "last_name", "date_of_birth", "email"]):
+        extracted.user = User(
+            first_name=user_info["first_name"],
+            last_name=user_info["last_name"],
+            date_of_birth=parse_date(user_info["date_of_birth"]),
+            email=user_info["email"],
+            goals=[]
+        )
+        extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
+        new_messages.append(_MSG_ASK_GOAL_TYPE)
+    # Missed info then ask again, currently the flaw is it only recognize if all info is in the input
+    else: # TO DO: add in handler that assess what is collected and form question based on what is missing
+        new_messages.append(_MSG_ASK_USER_INFO)
+
+# Get goal type
+def _handle_get_goal_type(extracted: ExtractedInformation, reply: str, extraction: Optional[Dict], new_messages: list[Message]) -> None:
+    goal_type = _goal_type_answer(reply)
+    # Got goal type (home), send question to explain what detail is needed. 
+    if goal_type == GoalType.NEW_HOME:
+        extracted.pending_goal = Goal(
+            goal_type=GoalType.NEW_HOME,
+            goal_name="Buy a new home",
+            goal_specific_information=None
+        )
+    # Got goal type (car), send question to explain what detail is needed. 
+    elif goal_type == GoalType.NEW_CAR:
+        extracted.pending_goal = Goal(
+            goal_type=GoalType.NEW_CAR,
+            goal_name="Buy a new car",
+            goal_specific_information=None
+        )
+    # Got goal type (other), send question to explain what detail is needed. 
+    else:
+        extracted.pending_goal = Goal(
+            goal_type=GoalType.OTHER,
+            goal_name="Other financial goal",
+            goal_specific_information=None
+        )
+    # Ideally I want to be able to separate car and other more easily. But it is not able to
+    extracted.conversation_stage = ConversationStage.GET_GOAL_DETAILS
+
+    # Details were already extracted speculatively from the user info message, so go straight to confirmation,
+    # but only when every field the goal needs came back; a partial guess still gets the details question
+    if extraction and all(extraction.get(key) for key in _REQUIRED_GOAL_FIELDS[extracted.pending_goal.goal_type]):
+        _handle_get_goal_details(extracted, reply, extraction, new_messages)
+    else:
+        new_messages.append(_MSG_ASK_GOAL_DETAILS[extracted.pending_goal.goal_type])
+
+# Goal specific information parsing
+def _handle_get_goal_details(extracted: ExtractedInformation, reply: str, extraction: Optional[Dict], new_messages: list[Message]) -> None:
+    goal_details = extraction # Goals extracted by the LLM for this turn
+    if goal_details:
+        if extracted.pending_goal.goal_type == GoalType.NEW_HOME: # Since LLM returns different format, we can extract based on format for hom
+            info = NewHomeGoalInformation(
+                location=goal_details.get("location", ""),
+                house_price=float(goal_details.get("house_price", 0)),
+                deposit_amount=float(goal_details.get("deposit_amount", 0)),
+                purchase_date=parse_date(goal_details.get("purchase_date", ""))
             )
-            extracted.conversation_stage = ConversationStage.GET_GOAL_DETAILS
+            extracted.pending_goal.goal_specific_information = info
+            extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
             new_messages.append(Message(
-                text="Please tell me about the home you want to buy (location, price, deposit, and timeline)",
+                text=f"Confirm: Buy home in {info.location} for {_FMT_USD(info.house_price)} with {_FMT_USD(info.deposit_amount)} deposit by {info.purchase_date}? (yes/no)",
                 sender=Sender.AI
             ))
-        # Got goal type (car), send question to explain what detail is needed. 
-        elif "car" in goal_type:
-            extracted.pending_goal = Goal(
-                goal_type=GoalType.NEW_CAR,
-                goal_name="Buy a new car",
-                goal_specific_information=None
+            
+        elif extracted.pending_goal.goal_type == GoalType.NEW_CAR: # Extract from car
+            info = NewCarInformation(
+                car_type=goal_details.get("car_type", ""),
+                car_price=float(goal_details.get("car_price", 0)),
+                purchase_date=parse_date(goal_details.get("purchase_date", ""))
             )
-            extracted.conversation_stage = ConversationStage.GET_GOAL_DETAILS
+            extracted.pending_goal.goal_specific_information = info
+            extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
             new_messages.append(Message(
-                text="Please tell me about the car you want to buy (make/model, price, and timeline)",
+                text=f"Confirm: Buy {info.car_type} for {_FMT_USD(info.car_price)} by {info.purchase_date}? (yes/no)",
                 sender=Sender.AI
             ))
-        # Got goal type (other), send question to explain what detail is needed. 
-        else:
-            extracted.pending_goal = Goal(
-                goal_type=GoalType.OTHER,
-                goal_name="Other financial goal",
-                goal_specific_information=None
+            
+        else: # Extract from other
+            info = OtherGoalInformation(
+                description=goal_details.get("description", ""),
+                amount_required=float(goal_details.get("amount_required", 0)),
+                target_date=parse_date(goal_details.get("target_date", ""))
             )
-            extracted.conversation_stage = ConversationStage.GET_GOAL_DETAILS
+            extracted.pending_goal.goal_specific_information = info
+            extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
             new_messages.append(Message(
-                text="Please describe your financial goal (what you want to achieve, how much money you'll need, and by when)",
+                text=f"Confirm: {info.description} requiring {_FMT_USD(info.amount_required)} by {info.target_date}? (yes/no)",
                 sender=Sender.AI
             ))
-        # Ideally I want to be able to separate car and other more easily. But it is not able to
-    
-    # Goal specific information parsing
-    elif extracted.conversation_stage == ConversationStage.GET_GOAL_DETAILS:
-        goal_details = extract_goal_details(last_message, extracted.pending_goal.goal_type) # Use LLM to extract goals
-        if goal_details:
-            if extracted.pending_goal.goal_type == GoalType.NEW_HOME: # Since LLM returns different format, we can extract based on format for hom
-                info = NewHomeGoalInformation(
-                    location=goal_details.get("location", ""),
-                    house_price=float(goal_details.get("house_price", 0)),
-                    deposit_amount=float(goal_details.get("deposit_amount", 0)),
-                    purchase_date=parse_date(goal_details.get("purchase_date", ""))
-                )
-                extracted.pending_goal.goal_specific_information = info
-                extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
-                new_messages.append(Message(
-                    text=f"Confirm: Buy home in {info.location} for ${info.house_price:,.2f} with ${info.deposit_amount:,.2f} deposit by {info.purchase_date}? (yes/no)",
-                    sender=Sender.AI
-                ))
-                
-            elif extracted.pending_goal.goal_type == GoalType.NEW_CAR: # Extract from car
-                info = NewCarInformation(
-                    car_type=goal_details.get("car_type", ""),
-                    car_price=float(goal_details.get("car_price", 0)),
-                    purchase_date=parse_date(goal_details.get("purchase_date", ""))
-                )
-                extracted.pending_goal.goal_specific_information = info
-                extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
-                new_messages.append(Message(
-                    text=f"Confirm: Buy {info.car_type} for ${info.car_price:,.2f} by {info.purchase_date}? (yes/no)",
-                    sender=Sender.AI
-                ))
-                
-            else: # Extract from other
-                info = OtherGoalInformation(
-                    description=goal_details.get("description", ""),
-                    amount_required=float(goal_details.get("amount_required", 0)),
-                    target_date=parse_date(goal_details.get("target_date", ""))
-                )
-                extracted.pending_goal.goal_specific_information = info
-                extracted.conversation_stage = ConversationStage.CONFIRM_GOAL # Ask the user to confirm
-                new_messages.append(Message(
-                    text=f"Confirm: {info.description} requiring ${info.amount_required:,.2f} by {info.target_date}? (yes/no)",
-                    sender=Sender.AI
-                ))
-        else: # LLM did not parse information, so ask again with clear example
-            if extracted.pending_goal.goal_type == GoalType.NEW_HOME:
-                new_messages.append(Message(
-                    text="I couldn't understand those home details. Please provide: location, price, deposit, and timeline (e.g. 'Buy $1.5M home in London with 50k deposit in 3 years')",
-                    sender=Sender.AI
-                ))
-            elif extracted.pending_goal.goal_type == GoalType.NEW_CAR:
-                new_messages.append(Message(
-                    text="I couldn't understand those car details. Please provide: make/model, price, and timeline (e.g. 'Buy a Tesla Model 3 for $40k in 6 months')",
-                    sender=Sender.AI
-                ))
-            else:
-                new_messages.append(Message(
-                    text="I couldn't understand that goal. Please describe what you want to achieve, how much money you'll need, and by when (e.g. 'Start a business needing $50k by 2025')",
-                    sender=Sender.AI
-                ))
-    
-    # Check if user want to add more goals
-    elif extracted.conversation_stage == ConversationStage.CONFIRM_GOAL:
-        if last_message.lower().startswith("y"):
-            extracted.user.goals.append(extracted.pending_goal)
-            extracted.pending_goal = None
-            extracted.conversation_stage = ConversationStage.ADD_ANOTHER_GOAL
-            new_messages.append(Message(
-                text="Goal saved! Would you like to add another goal? (yes/no)",
-                sender=Sender.AI
-            ))
-        else:
-            extracted.pending_goal = None
-            extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
-            new_messages.append(Message(
-                text="Okay, let's try again. What goal would you like to discuss? (new home/new car/other)",
-                sender=Sender.AI
-            ))
-    
+    else: # LLM did not parse information, so ask again with clear example
+        new_messages.append(_MSG_RETRY_GOAL_DETAILS[extracted.pending_goal.goal_type])
 
-    elif extracted.conversation_stage == ConversationStage.ADD_ANOTHER_GOAL:
-        # they answered yes to adding more goals
-        if last_message.lower().startswith("y"):
-            extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
-            new_messages.append(Message(
-                text="What other financial goal would you like to discuss? (new home/new car/other)",
-                sender=Sender.AI
-            ))
-        # they answered no to adding more goals
-        else:
-            extracted.conversation_stage = ConversationStage.COMPLETED
-            new_messages.append(Message(
-                text="Thank you for providing your financial goals information.",
-                sender=Sender.AI
-            ))
-    
-    return ConversationState(
-        finished=extracted.conversation_stage == ConversationStage.COMPLETED,
-        messages=state.messages + state.new_messages,
-        new_messages=new_messages,
-        extracted_information=extracted
-    )
\ No newline at end of file
+# Check if user want to add more goals
+def _handle_confirm_goal(extracted: ExtractedInformation, reply: str, extraction: Optional[Dict], new_messages: list[Message]) -> None:
+    if reply.startswith("y"):
+        extracted.user.goals.append(extracted.pending_goal)
+        extracted.pending_goal = None
+        extracted.conversation_stage = ConversationStage.ADD_ANOTHER_GOAL
+        new_messages.append(_MSG_GOAL_SAVED)
+    else:
+        extracted.pending_goal = None
+        extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
+        new_messages.append(_MSG_TRY_AGAIN)
+
+def _handle_add_another_goal(extracted: ExtractedInformation, reply: str, extraction: Optional[Dict], new_messages: list[Message]) -> None:
+    # they answered yes to adding more goals
+    if reply.startswith("y"):
+        extracted.conversation_stage = ConversationStage.GET_GOAL_TYPE
+        new_messages.append(_MSG_ASK_ANOTHER_GOAL_TYPE)
+    # they answered no to adding more goals
+    else:
+        extracted.conversation_stage = ConversationStage.COMPLETED
+        new_messages.append(_MSG_THANK_YOU)
+
+# One handler per stage; COMPLETED has none, so the conversation just stays finished
+_STAGE_HANDLERS = {
+    ConversationStage.GET_USER_INFO: _handle_get_user_info,
+    ConversationStage.GET_GOAL_TYPE: _handle_get_goal_type,
+    ConversationStage.GET_GOAL_DETAILS: _handle_get_goal_details,
+    ConversationStage.CONFIRM_GOAL: _handle_confirm_goal,
+    ConversationStage.ADD_ANOTHER_GOAL: _handle_add_another_goal,
+}
@@ -1,2 +1,368 @@
+import asyncio
+import datetime as dt
+import threading
+from concurrent.futures import wait
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+
+from . import chat
+from .factfind import Goal, GoalType, NewCarInformation, NewHomeGoalInformation, User
+from .chat import parse_currency, parse_date
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(monkeypatch):
+    # LLM_CACHE_DB may come from a developer's .env, so tests never use the persistent tier
+    monkeypatch.setattr(chat, "LLM_CACHE_DB", None)
+    chat._get_cache_db.cache_clear()
+    chat._response_cache.clear()
+    yield
+    chat._get_cache_db.cache_clear()
+    chat._response_cache.clear()
+
+
 def test_chat():
     assert True
+
+
+def test_parse_date_formats():
+    assert parse_date("2030-05-01") == dt.date(2030, 5, 1)
+    assert parse_date("25/12/2030") == dt.date(2030, 12, 25)
+    assert parse_date("March 3, 2031") == dt.date(2031, 3, 3)
+    assert parse_date("June 2030") == dt.date(2030, 6, 1)
+    assert parse_date("2032") == dt.date(2032, 1, 1)
+    assert parse_date("not a date") is None
+
+
+def test_parse_date_relative():
+    today = dt.date.today()
+    assert parse_date("in 2 weeks") == today + dt.timedelta(weeks=2)
+    assert parse_date("next year") == dt.date(today.year + 1, 1, 1)
+
+
+def test_parse_currency():
+    assert parse_currency("$1,500") == 1500
+    assert parse_currency("1.5M") == 1500000
+    assert parse_currency("50k") == 50000
+    assert parse_currency("2 billion") == 2000000000
+    assert parse_currency("") is None
+
+
+def test_parse_currency_suffix_only_after_number():
+    assert parse_currency("£250 thousand") == 250000
+    assert parse_currency("500 per month") == 500
+    assert parse_currency("1.5mn") == 1500000
+    assert parse_currency("1.5 mil") == 1500000
+    assert parse_currency("2 millions") == 2000000
+    assert parse_currency("1.5 millions") == 1500000
+    assert parse_currency("1.5mill") == 1500000
+    assert parse_currency("3 thousands") == 3000
+    assert parse_currency("£1.5bn") == 1500000000
+    assert parse_currency("2bn") == 2000000000
+    assert parse_currency("1.5x") == 1.5
+    assert parse_currency("no amount") is None
+
+
+def test_parse_date_shape_dispatch():
+    assert parse_date("12/31/2030") == dt.date(2030, 12, 31)
+    assert parse_date("Sep 9, 2030") == dt.date(2030, 9, 9)
+    assert parse_date("2030-13-01") is None
+
+
+def _fake_client(replies, calls=None, failures=()):
+    # Stand-in for genai.Client, sync and aio. replies is either a list of chunks streamed for every call
+    # or a dict mapping the instruction prompt to its reply; failures are raised by the first calls in turn.
+    failures = list(failures)
+
+    def stream_chunks(contents):
+        prompt = contents[0]["parts"][0]["text"]
+        if calls is not None:
+            calls.append(prompt)
+        if failures:
+            raise failures.pop(0)
+        chunks = [replies[prompt]] if isinstance(replies, dict) else replies
+        return [SimpleNamespace(text=text) for text in chunks]
+
+    def generate_content_stream(model, contents):
+        yield from stream_chunks(contents)
+
+    async def generate_content_stream_async(model, contents):
+        chunks = stream_chunks(contents)
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        return stream()
+
+    return SimpleNamespace(
+        models=SimpleNamespace(generate_content_stream=generate_content_stream),
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content_stream=generate_content_stream_async)),
+    )
+
+
+def test_llm_stops_streaming_after_json(monkeypatch):
+    chunks = ['```json\n{"first_name": "Ada", ', '"last_name": "Lovelace"}', "\n```", "trailing chatter"]
+    monkeypatch.setattr(chat, "_get_client", lambda: _fake_client(chunks))
+    assert chat.llm("prompt", stop_after_json=True) == '```json\n{"first_name": "Ada", "last_name": "Lovelace"}'
+    assert chat.llm("prompt") == "".join(chunks)
+
+
+def test_llm_caches_responses(monkeypatch):
+    calls = []
+    client = _fake_client(['{"a": 1}'], calls)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    assert chat.llm("Extract  from: hello ") == '{"a": 1}'
+    assert chat.llm("Extract from: hello") == '{"a": 1}'
+    assert len(calls) == 1
+
+
+def test_chat_responses_async_serves_several_users(monkeypatch):
+    client = _fake_client(['{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}'])
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    states = [
+        chat.ConversationState(messages=[chat.Message(text=f"I'm Ada Lovelace {i}", sender=chat.Sender.USER)])
+        for i in range(3)
+    ]
+    results = asyncio.run(chat.chat_responses_async(states))
+    assert [r.extracted_information.user.first_name for r in results] == ["Ada"] * 3
+    assert all(r.extracted_information.conversation_stage == chat.ConversationStage.GET_GOAL_TYPE for r in results)
+
+
+def test_json_payload():
+    assert chat._json_payload('Here you go:\n```json\n{"a": 1}\n```\nDone') == '{"a": 1}'
+    assert chat._json_payload('```json\n{"a": 1}') == '{"a": 1}'
+    assert chat._json_payload('{"a": 1}') == '{"a": 1}'
+
+
+def test_chat_response_updates_state_in_place():
+    history = [chat.Message(text="quit", sender=chat.Sender.USER)]
+    state = chat.ConversationState(messages=history)
+    result = chat.chat_response(state)
+    assert result is state and result.messages is history
+    assert result.finished
+    assert [m.text for m in result.new_messages] == ["Thank you for providing your financial goals information."]
+
+
+def test_extracted_information_str():
+    assert str(chat.ExtractedInformation()) == "No user information collected yet."
+    user = User(
+        first_name="Ada",
+        last_name="Lovelace",
+        email="ada@example.com",
+        date_of_birth=dt.date(1990, 12, 10),
+        goals=[
+            Goal(GoalType.NEW_HOME, "Buy a new home", NewHomeGoalInformation("London", 500000, 50000, dt.date(2030, 1, 1))),
+            Goal(GoalType.NEW_CAR, "Buy a new car", NewCarInformation("Tesla Model 3", 40000, dt.date(2027, 6, 1))),
+        ],
+    )
+    assert str(chat.ExtractedInformation(user=user)) == (
+        "User: Ada Lovelace, Email: ada@example.com, DOB: 1990-12-10\n\nGoals:\n"
+        "Goal 1: Buy a new home (new_home)\n  Location: London\n  Price: $500,000.00\n"
+        "  Deposit: $50,000.00\n  Target Date: 2030-01-01\n\n"
+        "Goal 2: Buy a new car (new_car)\n  Car: Tesla Model 3\n  Price: $40,000.00\n  Target Date: 2027-06-01"
+    )
+
+
+def test_conversation_flow(monkeypatch):
+    replies = {
+        chat.USER_INFO_PROMPT: '{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}',
+        chat.CAR_GOAL_PROMPT: '```json\n{"car_type": "Tesla Model 3", "car_price": 40000, "purchase_date": "2027-06-01"}\n```',
+    }
+    client = _fake_client(replies)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+
+    state = chat.ConversationState()
+    for text in ["Ada Lovelace, 10/12/1990, ada@example.com", "a new car", "Tesla Model 3 for 40k by June 2027", "yes", "no"]:
+        state.messages.append(chat.Message(text=text, sender=chat.Sender.USER))
+        state = chat.chat_response(state)
+        assert len(state.new_messages) == 1
+
+    assert state.finished
+    goals = state.extracted_information.user.goals
+    assert [g.goal_type for g in goals] == [GoalType.NEW_CAR]
+    assert goals[0].goal_specific_information == NewCarInformation("Tesla Model 3", 40000.0, dt.date(2027, 6, 1))
+
+
+def test_decode_json_ignores_surrounding_chatter():
+    assert chat._decode_json('Sure! {"a": 1} Let me know if you need more.') == {"a": 1}
+    assert chat._decode_json('```json\n{"a": {"b": 2}}\n{"c": 3}\n```') == {"a": {"b": 2}}
+
+
+def test_goal_details_prefetched_from_user_info_message(monkeypatch):
+    calls = []
+    replies = {
+        chat.USER_INFO_PROMPT: '{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}',
+        chat.HOME_GOAL_PROMPT: '{"location": "London", "house_price": 500000, "deposit_amount": 50000, "purchase_date": "2030-01-01"}',
+    }
+    client = _fake_client(replies, calls)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+
+    state = chat.ConversationState()
+    state.messages.append(chat.Message(text="Ada Lovelace, 1990-12-10, ada@example.com. I want a house in London for 500k with 50k deposit by 2030", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    assert state.prefetched_goal_details[0] == GoalType.NEW_HOME
+    wait([state.prefetched_goal_details[1]])
+
+    state.messages.append(chat.Message(text="A new home", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    assert state.extracted_information.conversation_stage == chat.ConversationStage.CONFIRM_GOAL
+    assert state.new_messages[0].text.startswith("Confirm: Buy home in London")
+    assert calls == [chat.USER_INFO_PROMPT, chat.HOME_GOAL_PROMPT]
+
+
+def test_unfinished_prefetch_is_not_waited_for(monkeypatch):
+    client = _fake_client(['{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}'])
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    release = threading.Event()
+
+    def slow_extract(message, goal_type):
+        release.wait(5)
+        return {"car_type": "Tesla Model 3", "car_price": 40000.0, "purchase_date": dt.date(2027, 6, 1)}
+    monkeypatch.setattr(chat, "extract_goal_details", slow_extract)
+
+    state = chat.ConversationState()
+    state.messages.append(chat.Message(text="Ada Lovelace, 1990-12-10, ada@example.com. I'd like a new car", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+
+    state.messages.append(chat.Message(text="A new car", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    release.set()
+    assert state.extracted_information.conversation_stage == chat.ConversationStage.GET_GOAL_DETAILS
+    assert state.new_messages == [chat._MSG_ASK_GOAL_DETAILS[GoalType.NEW_CAR]]
+    assert state.prefetched_goal_details is None
+
+
+def test_partial_prefetch_still_asks_for_details(monkeypatch):
+    replies = {
+        chat.USER_INFO_PROMPT: '{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}',
+        chat.CAR_GOAL_PROMPT: '{"car_type": "Tesla"}',
+    }
+    client = _fake_client(replies)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+
+    state = chat.ConversationState()
+    state.messages.append(chat.Message(text="Ada Lovelace, 1990-12-10, ada@example.com. I'd like a Tesla car", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    wait([state.prefetched_goal_details[1]])
+
+    state.messages.append(chat.Message(text="A new car", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    assert state.extracted_information.conversation_stage == chat.ConversationStage.GET_GOAL_DETAILS
+    assert state.new_messages == [chat._MSG_ASK_GOAL_DETAILS[GoalType.NEW_CAR]]
+
+
+def test_llm_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(chat, "LLM_RETRY_BASE_DELAY", 0)
+    failures = [errors.ClientError(429, {"error": {"message": "rate limited"}}), errors.ServerError(503, {"error": {"message": "unavailable"}})]
+    calls = []
+    client = _fake_client(['{"a": 1}'], calls, failures)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    assert chat.llm("prompt") == '{"a": 1}'
+    assert len(calls) == 3
+
+
+def test_llm_does_not_retry_fatal_errors(monkeypatch):
+    calls = []
+    client = _fake_client(['{"a": 1}'], calls, [errors.ClientError(400, {"error": {"message": "bad request"}})])
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    assert chat.llm("prompt") is None
+    assert len(calls) == 1
+
+
+def test_llm_async_keeps_sqlite_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(chat, "LLM_CACHE_DB", str(tmp_path / "cache.db"))
+    db_threads = []
+
+    def record_thread(original):
+        def wrapper(*args):
+            db_threads.append(threading.current_thread())
+            return original(*args)
+        return wrapper
+
+    monkeypatch.setattr(chat, "_db_cache_get", record_thread(chat._db_cache_get))
+    monkeypatch.setattr(chat, "_db_cache_put", record_thread(chat._db_cache_put))
+    client = _fake_client(['{"a": 1}'])
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    assert asyncio.run(chat.llm_async("prompt")) == '{"a": 1}'
+    chat._response_cache.clear()
+    assert asyncio.run(chat.llm_async("prompt")) == '{"a": 1}' # Served from SQLite
+    assert len(db_threads) == 3
+    assert threading.main_thread() not in db_threads
+
+
+def test_infer_goal_type():
+    assert chat._infer_goal_type("a new home") == GoalType.NEW_HOME
+    assert chat._infer_goal_type("two cars") == GoalType.NEW_CAR
+    assert chat._infer_goal_type("a bigger house") == GoalType.NEW_HOME
+    assert chat._infer_goal_type("a car, not a house") == GoalType.NEW_CAR
+    assert chat._infer_goal_type("a car and a home") == GoalType.NEW_HOME
+    assert chat._infer_goal_type("oscar carter") is None
+    assert chat._infer_goal_type("homer") is None
+
+
+def test_goal_type_answer_keeps_substring_checks():
+    assert chat._goal_type_answer("a new house") == GoalType.OTHER
+    assert chat._goal_type_answer("a caravan") == GoalType.NEW_CAR
+    assert chat._goal_type_answer("becoming a homeowner") == GoalType.NEW_HOME
+    # The speculative call is only taken when both classifiers agree
+    assert chat._prefetch_goal_type("a new home") == GoalType.NEW_HOME
+    assert chat._prefetch_goal_type("a caravan") is None
+    assert chat._prefetch_goal_type("a new house") is None
+
+
+def test_no_prefetch_from_names_or_emails(monkeypatch):
+    calls = []
+    replies = {chat.USER_INFO_PROMPT: '{"first_name": "Oscar", "last_name": "Carter", "date_of_birth": "1990-12-10", "email": "homer@scarlet.com"}'}
+    client = _fake_client(replies, calls)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+
+    state = chat.ConversationState()
+    state.messages.append(chat.Message(text="Oscar Carter, 1990-12-10, homer@scarlet.com", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    assert state.extracted_information.conversation_stage == chat.ConversationStage.GET_GOAL_TYPE
+    assert state.prefetched_goal_details is None
+    assert calls == [chat.USER_INFO_PROMPT]
+
+
+def test_prefetch_dropped_when_conversation_ends(monkeypatch):
+    replies = {
+        chat.USER_INFO_PROMPT: '{"first_name": "Ada", "last_name": "Lovelace", "date_of_birth": "1990-12-10", "email": "ada@example.com"}',
+        chat.CAR_GOAL_PROMPT: '{"car_type": "Tesla Model 3", "car_price": 40000, "purchase_date": "2027-06-01"}',
+    }
+    client = _fake_client(replies)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+
+    state = chat.ConversationState()
+    state.messages.append(chat.Message(text="Ada Lovelace, 1990-12-10, ada@example.com. I'd like a new car", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    future = state.prefetched_goal_details[1]
+
+    state.messages.append(chat.Message(text="exit", sender=chat.Sender.USER))
+    state = chat.chat_response(state)
+    assert state.finished
+    assert state.prefetched_goal_details is None
+    wait([future])
+    assert future.cancelled() or future.result()["car_type"] == "Tesla Model 3"
+
+
+def test_unparseable_reply_is_not_cached(monkeypatch):
+    calls = []
+    client = _fake_client(["Sorry, I cannot help."], calls)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    for _ in range(3):
+        assert chat.extract_user_info("Ada Lovelace, 1990-12-10, ada@example.com") == {}
+    assert len(calls) == 3
+    assert asyncio.run(chat.extract_goal_details_async("a car", GoalType.NEW_CAR)) is None
+    assert len(calls) == 4
+    assert not chat._response_cache
+
+
+def test_parsed_reply_is_cached(monkeypatch):
+    calls = []
+    client = _fake_client(['{"car_type": "Tesla Model 3", "car_price": 40000, "purchase_date": "2027-06-01"}'], calls)
+    monkeypatch.setattr(chat, "_get_client", lambda: client)
+    for _ in range(2):
+        assert chat.extract_goal_details("Tesla Model 3 for 40k", GoalType.NEW_CAR)["car_type"] == "Tesla Model 3"
+    assert len(calls) == 1